@@ -1,11 +1,29 @@
 """Scrape job posts from indeed.com and dice.com """
 
+import os
 import sys
 import time
+import sqlite3
+import argparse
+import threading
+from datetime import datetime
 
 sys.path.append("scraper")  # used for importing modules inside scraper dir
 
 from scraper import indeed, dice
+import utils
+import cache
+import store
+import archive
+import budget
+import egress
+import merge
+import replay
+import profiler
+
+
+# every website that can be scraped, in the order shown to the user
+SCRAPERS = (dice.DiceScraper, indeed.IndeedScraper)
 
 
 def welcome():
@@ -13,10 +31,12 @@ def welcome():
     print("Welcome to Job scraper.")
     print("-" * 40)
     print("From which website you want to scrape?")
-    print("\t1 - www.dice.com\n\t2 - www.indeed.com\n")
+    for i, scraper_class in enumerate(SCRAPERS, start=1):
+        print(f"\t{i} - {scraper_class.website}")
+    print(f"\t{len(SCRAPERS) + 1} - all of them (at the same time)\n")
     ch = input("Your choice: ")
 
-    if ch == "1" or ch == "2":
+    if ch.isdigit() and 1 <= int(ch) <= len(SCRAPERS) + 1:
         return int(ch)
     else:
         print("Wrong choice. Exitting...")
@@ -36,20 +56,327 @@ def get_job_title():
     return query, location
 
 
+def parse_duration(value):
+    """Convert a duration like 90, 90s, 20m or 1.5h to seconds."""
+    units = {"s": 1, "m": 60, "h": 3600}
+    try:
+        if value[-1].lower() in units:
+            return float(value[:-1]) * units[value[-1].lower()]
+        return float(value)
+    except (ValueError, IndexError):
+        raise argparse.ArgumentTypeError(f"invalid duration: {value!r}")
+
+
+def parse_args():
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="time fetch, parse and each extractor, and save a flamegraph-compatible report",
+    )
+    parser.add_argument(
+        "--profile-top",
+        type=int,
+        default=15,
+        metavar="N",
+        help="number of sections and slowest jobs to show in the profile report",
+    )
+    parser.add_argument(
+        "--profile-fixtures",
+        metavar="DIR",
+        help="save the costliest job descriptions to DIR as HTML fixtures",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=10000,
+        metavar="N",
+        help="number of extracted descriptions to keep in memory (0 disables it)",
+    )
+    parser.add_argument(
+        "--cache-db",
+        metavar="PATH",
+        help="SQLite file to persist extracted descriptions between runs",
+    )
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument(
+        "--listing-only",
+        action="store_true",
+        help="save jobs from the result pages only and queue their descriptions",
+    )
+    mode.add_argument(
+        "--two-phase",
+        action="store_true",
+        help="save jobs from the result pages and enrich them in the background",
+    )
+    mode.add_argument(
+        "--enrich",
+        action="store_true",
+        help="fetch descriptions of queued jobs (resumes an earlier listing run)",
+    )
+    parser.add_argument(
+        "--db",
+        metavar="PATH",
+        help="also save jobs to a SQLite database that can be searched with 'query'",
+    )
+
+    parser.add_argument(
+        "--archive",
+        metavar="PATH",
+        help="save every raw response to a compressed archive that can be replayed",
+    )
+
+    parser.add_argument(
+        "--proxy",
+        action="append",
+        default=[],
+        metavar="URL",
+        help="send requests through this proxy (can be given several times)",
+    )
+    parser.add_argument(
+        "--proxy-file",
+        metavar="PATH",
+        help="file with one proxy URL per line",
+    )
+    parser.add_argument(
+        "--source-address",
+        action="append",
+        default=[],
+        metavar="IP",
+        help="send requests from this local address (can be given several times)",
+    )
+    parser.add_argument(
+        "--egress-rate",
+        type=float,
+        default=1.0,
+        metavar="N",
+        help="requests per second allowed through each proxy or address",
+    )
+
+    parser.add_argument(
+        "--max-duration",
+        type=parse_duration,
+        metavar="TIME",
+        help="stop after this long (like 20m or 1h), newest jobs are scraped first",
+    )
+    parser.add_argument(
+        "--max-requests",
+        type=int,
+        metavar="N",
+        help="stop after sending this many requests, newest jobs are scraped first",
+    )
+
+    commands = parser.add_subparsers(dest="command")
+    query = commands.add_parser("query", help="search jobs saved to the database")
+    query.add_argument("keywords", nargs="*", help="full-text search terms")
+    query.add_argument("--db", default=argparse.SUPPRESS, metavar="PATH")
+    query.add_argument("--min-salary", type=int, default=0, metavar="AMOUNT")
+    query.add_argument("--remote", action="store_true", help="remote jobs only")
+    query.add_argument("--site", choices=("dice", "indeed"))
+    query.add_argument("--limit", type=int, default=50)
+
+    replay_command = commands.add_parser(
+        "replay", help="extract jobs again from an archive of raw responses"
+    )
+    replay_command.add_argument("archive_path", metavar="ARCHIVE")
+    replay_command.add_argument("--db", default=argparse.SUPPRESS, metavar="PATH")
+    replay_command.add_argument(
+        "--workers",
+        type=int,
+        metavar="N",
+        help="processes to use (all cores by default)",
+    )
+
+    args = parser.parse_args()
+    if args.command == "query" and not args.db:
+        parser.error("query needs the database to search (--db PATH)")
+    return args
+
+
+def save_profile(args, query, site):
+    """Print the profile report and save the collapsed stacks to the Desktop."""
+    today = datetime.today().strftime("%Y-%m-%d")
+    filename = f"{query}-profile-{site}-{today}.folded"
+    profiler.write_collapsed_stacks(utils.get_desktop_path(filename))
+
+    print(profiler.report(args.profile_top))
+    print(f"\nCollapsed stacks are saved to Desktop with filename: {filename}")
+    if args.profile_fixtures:
+        saved = profiler.save_fixtures(args.profile_fixtures, args.profile_top)
+        print(f"Saved {len(saved)} slow job descriptions to {args.profile_fixtures}")
+
+
+def search_jobs(args):
+    """Print jobs in the database that match the query."""
+    result_store = store.ResultStore(args.db)
+    start = time.time()
+    try:
+        jobs = result_store.search(
+            " ".join(args.keywords),
+            min_salary=args.min_salary,
+            remote=args.remote,
+            site=args.site,
+            limit=args.limit,
+        )
+    except sqlite3.OperationalError as e:
+        print(f"Searching the database failed: {e}")
+        return
+    finally:
+        result_store.close()
+    elapsed = (time.time() - start) * 1000
+
+    for job in jobs:
+        remote = " (Remote)" if job["remote"] else ""
+        print(f"[{job['site']}] {job['title']} - {job['company']}{remote}")
+        print(f"\t{job['location']} | ${job['salary']} | {job['link']}")
+    print(f"\n{len(jobs)} jobs found in {elapsed:.1f} ms")
+
+
+def replay_archive(args):
+    """Extract jobs from an archive and save them to new CSV files."""
+    if not os.path.exists(args.archive_path):
+        print(f"The archive {args.archive_path} does not exist.")
+        return
+
+    stem = os.path.splitext(os.path.basename(args.archive_path))[0]
+    today = datetime.today().strftime("%Y-%m-%d")
+    filenames = set()
+
+    def save_rows(site, rows):
+        filename = f"{stem}-replay-{site}-{today}.csv"
+        filenames.add(filename)
+        utils.save_to_csv(rows, filename)
+        store.save(site, rows)
+
+    store.configure(args.db)
+    total = replay.replay(args.archive_path, SCRAPERS, save_rows, args.workers)
+    store.close()
+
+    print(f"\nExtracted {total} jobs. Saved to Desktop with filename(s):")
+    for filename in sorted(filenames):
+        print(f"\t{filename}")
+
+
+def run_scraper(scraper, args):
+    """Run the scraper in the mode chosen on the command line."""
+    if args.listing_only:
+        scraper.list_all_pages()
+    elif args.two_phase:
+        # descriptions are enriched while the listing pages are still being saved
+        listing_done = threading.Event()
+        enricher = threading.Thread(target=scraper.enrich_pending, args=(listing_done,))
+        enricher.start()
+        try:
+            scraper.list_all_pages()
+        finally:
+            listing_done.set()
+            enricher.join()
+    elif budget.run_budget.limited:
+        # result pages are worth more than descriptions, so they go first and
+        # descriptions are fetched newest first with whatever budget is left
+        scraper.list_all_pages()
+        scraper.enrich_pending()
+    else:
+        scraper.extract_all_pages()
+
+
+def setup_egress_pools(args):
+    """Spread the requests of every scraper over the given proxies and addresses."""
+    proxies = list(args.proxy)
+    if args.proxy_file:
+        with open(args.proxy_file) as file:
+            proxies += [line.strip() for line in file if line.strip()]
+
+    pools = {}
+    for scraper_class in SCRAPERS:
+        # each website gets its own pool, since they throttle independently
+        pool = egress.create_pool(proxies, args.source_address, args.egress_rate)
+        if pool:
+            sys.modules[scraper_class.__module__].session = pool
+            pools[scraper_class.site] = pool
+    return pools
+
+
+def run_concurrently(tasks):
+    """Run the tasks (functions) in their own threads and wait for all of them."""
+    if len(tasks) == 1:
+        tasks[0]()
+        return
+
+    threads = [threading.Thread(target=task) for task in tasks]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
 def main():
+    args = parse_args()
+    if args.command == "query":
+        search_jobs(args)
+        return
+    if args.command == "replay":
+        replay_archive(args)
+        return
+
+    if args.profile:
+        profiler.enable()
+    cache.configure(args.cache_size, args.cache_db)
+    store.configure(args.db)
+    utils.sinks.append(store.save)
+    archive.configure(args.archive)
+    pools = setup_egress_pools(args)
+
     start = time.time()
 
     choice = welcome()
-    if choice == 1:
-        query, location = get_job_title()
-        scraper = dice.DiceScraper(query, location)
-        print(f"Searching {query} jobs on www.dice.com ...\n")
-        scraper.extract_all_pages()
-    elif choice == 2:
+    if choice > len(SCRAPERS):
+        scraper_classes = SCRAPERS
+        site = "all"
+    else:
+        scraper_classes = [SCRAPERS[choice - 1]]
+        site = scraper_classes[0].site
+
+    if args.enrich:
+        query = "enrich"
+        scrapers = [scraper_class("") for scraper_class in scraper_classes]
+        for scraper in scrapers:
+            print(
+                f"Enriching {len(scraper.queue)} queued jobs from {scraper.website} ..."
+            )
+        print()
+        budget.configure(args.max_duration, args.max_requests)
+        run_concurrently([scraper.enrich_pending for scraper in scrapers])
+    else:
         query, location = get_job_title()
-        scraper = indeed.IndeedScraper(query, location)
-        print(f"Searching {query} jobs on www.indeed.com ...\n")
-        scraper.extract_all_pages()
+        scrapers = [scraper_class(query, location) for scraper_class in scraper_classes]
+        if len(scrapers) > 1:
+            # jobs from all websites are also merged into a single file
+            today = datetime.today().strftime("%Y-%m-%d")
+            merged = merge.MergedWriter(f"{query}-job-list-all-{today}.csv")
+            utils.sinks.append(merged.add)
+
+        websites = " and ".join(scraper.website for scraper in scrapers)
+        print(f"Searching {query} jobs on {websites} ...\n")
+        budget.configure(args.max_duration, args.max_requests)
+        # each scraper keeps its own session and throttling, so they can overlap
+        run_concurrently(
+            [lambda scraper=scraper: run_scraper(scraper, args) for scraper in scrapers]
+        )
+
+        if len(scrapers) > 1:
+            print(f"All jobs are merged to Desktop with filename: {merged.filename}")
+            print(f"({merged.duplicates} jobs posted on more than one website skipped)")
+
+    if args.profile:
+        save_profile(args, query, site)
+
+    for site_name, pool in pools.items():
+        print(f"\nEgress health for {site_name}:\n{pool.report()}")
+    print(cache.extraction_cache.stats())
+    cache.extraction_cache.close()
+    store.close()
 
     end = time.time()
     seconds = int(end - start)
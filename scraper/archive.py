@@ -0,0 +1,137 @@
+"""
+An append-only, zstd-compressed archive of raw responses.
+
+Every record is compressed on its own and written after a 4 byte length, so
+the archive can be read back without its index. The index (a JSON line per
+record, in `<archive>.idx`) tells where each record starts and what it is,
+which lets `replay` split the work between processes.
+"""
+
+import os
+import json
+import struct
+import threading
+from datetime import datetime
+
+try:
+    import zstandard
+except ImportError:  # only needed when archiving or replaying
+    zstandard = None
+
+
+LENGTH = struct.Struct(">I")
+
+
+def require_zstandard():
+    if zstandard is None:
+        raise RuntimeError(
+            "Archiving responses needs the zstandard package: pip install zstandard"
+        )
+
+
+class ResponseArchive:
+    """Append raw responses to an archive file and read them back."""
+
+    def __init__(self, path, level=10):
+        require_zstandard()
+        self.path = path
+        self.index_path = path + ".idx"
+        self.level = level
+        self._lock = threading.Lock()
+
+    def append(self, kind, url, body, **meta):
+        """Save the raw body of a response with what is needed to extract it again."""
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        header = json.dumps(
+            {
+                "kind": kind,
+                "url": url,
+                "fetched_at": datetime.now().isoformat(timespec="seconds"),
+                "meta": meta,
+            }
+        ).encode("utf-8")
+        # a compressor is not thread safe, so every call gets its own
+        compressor = zstandard.ZstdCompressor(level=self.level)
+        frame = compressor.compress(LENGTH.pack(len(header)) + header + body)
+
+        with self._lock:
+            with open(self.path, "ab") as file:
+                offset = file.tell()
+                file.write(LENGTH.pack(len(frame)) + frame)
+            entry = {"offset": offset, "size": len(frame), "kind": kind, "url": url}
+            with open(self.index_path, "a", encoding="utf-8") as file:
+                file.write(json.dumps(entry) + "\n")
+
+    def index(self, kinds=None):
+        """Return the index entries (only the given kinds if any)."""
+        if not os.path.exists(self.index_path):
+            self.rebuild_index()
+        entries = []
+        with open(self.index_path, encoding="utf-8") as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # cut off while it was written
+                if kinds is None or entry["kind"] in kinds:
+                    entries.append(entry)
+        return entries
+
+    def rebuild_index(self):
+        """
+        Recreate a lost index by walking through the archive. It stops at a
+        record that is cut off or damaged, like the last one of a killed run.
+        """
+        entries = []
+        with open(self.path, "rb") as file:
+            while True:
+                prefix = file.read(LENGTH.size)
+                if len(prefix) < LENGTH.size:
+                    break
+                (size,) = LENGTH.unpack(prefix)
+                offset = file.tell() - LENGTH.size
+                frame = file.read(size)
+                try:
+                    if len(frame) < size:
+                        raise ValueError("the record is cut off")
+                    header, _ = self._decode(frame)
+                except (zstandard.ZstdError, struct.error, ValueError) as e:
+                    print(f"Ignoring the rest of the archive from byte {offset}: {e}")
+                    break
+                entry = {"offset": offset, "size": size}
+                entry.update(kind=header["kind"], url=header["url"])
+                entries.append(entry)
+
+        with open(self.index_path, "w", encoding="utf-8") as file:
+            file.writelines(json.dumps(entry) + "\n" for entry in entries)
+
+    def read(self, entry, file=None):
+        """Return (header, body) of the record an index entry points to."""
+        if file is None:
+            with open(self.path, "rb") as file:
+                return self.read(entry, file)
+        file.seek(entry["offset"] + LENGTH.size)
+        return self._decode(file.read(entry["size"]))
+
+    def _decode(self, frame):
+        data = zstandard.ZstdDecompressor().decompress(frame)
+        (header_size,) = LENGTH.unpack(data[: LENGTH.size])
+        header_end = LENGTH.size + header_size
+        return json.loads(data[LENGTH.size : header_end]), data[header_end:]
+
+
+response_archive = None
+
+
+def configure(path):
+    """Archive every response fetched by the scrapers to the given file."""
+    global response_archive
+    response_archive = ResponseArchive(path) if path else None
+    return response_archive
+
+
+def record(kind, url, body, **meta):
+    """Archive a response (does nothing unless an archive is configured)."""
+    if response_archive is not None:
+        response_archive.append(kind, url, body, **meta)
@@ -0,0 +1,75 @@
+"""
+Limits on how long a run may take and how many requests it may send.
+
+The scrapers check the budget before fetching the next page or batch of job
+descriptions and stop cleanly once it is used up. Their progress and the
+enrichment queue are saved as they go, so the next run picks up from there.
+"""
+
+import time
+import threading
+
+
+class Budget:
+    """A time and/or request budget for a run (unlimited by default)."""
+
+    def __init__(self, max_duration=None, max_requests=None):
+        self.max_duration = max_duration
+        self.max_requests = max_requests
+        self.started = time.monotonic()
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    @property
+    def limited(self):
+        return self.max_duration is not None or self.max_requests is not None
+
+    def spend(self, requests=1):
+        """Count requests sent to a website."""
+        with self._lock:
+            self.requests += requests
+
+    def remaining_time(self):
+        if self.max_duration is None:
+            return float("inf")
+        return max(self.max_duration - (time.monotonic() - self.started), 0)
+
+    def remaining_requests(self):
+        if self.max_requests is None:
+            return float("inf")
+        with self._lock:
+            return max(self.max_requests - self.requests, 0)
+
+    def exhausted(self):
+        """Check whether the run should stop."""
+        return self.remaining_time() <= 0 or self.remaining_requests() <= 0
+
+
+run_budget = Budget()
+
+
+def configure(max_duration=None, max_requests=None):
+    """Start the budget of this run (the clock starts now)."""
+    global run_budget
+    run_budget = Budget(max_duration, max_requests)
+    return run_budget
+
+
+def spend(requests=1):
+    """Count requests against the budget of this run."""
+    run_budget.spend(requests)
+
+
+def exhausted():
+    """Check whether the budget of this run is used up."""
+    return run_budget.exhausted()
+
+
+def batch_size(size):
+    """Shrink a batch of requests so it does not go over the request budget."""
+    return int(min(size, run_budget.remaining_requests()))
+
+
+def clamp(seconds):
+    """Shorten a pause so it does not last past the end of the budget."""
+    return min(seconds, run_budget.remaining_time())
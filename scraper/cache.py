@@ -0,0 +1,163 @@
+"""
+Memoization of job description extraction results.
+
+Staffing agencies post the same description under many listings, so the
+(expectations, qualification, experience) extracted from a description are
+cached by a hash of its normalized text. Results live in a size-bounded LRU in
+memory and, optionally, in a SQLite file that persists between runs.
+"""
+
+import re
+import json
+import sqlite3
+import hashlib
+import inspect
+import threading
+from collections import OrderedDict
+
+import utils
+
+
+# functions whose output is cached, any change to them invalidates the cache
+EXTRACTORS = (
+    utils.match_from_p_tag,
+    utils.match_from_text,
+    utils.extract_from_sibling,
+    utils.get_responsibility,
+    utils.get_qualification,
+    utils.get_skills_and_experience,
+    utils.extract_description,
+    utils.get_text,
+)
+
+
+def extractor_version():
+    """Fingerprint the source of the extractors so edits invalidate old results."""
+    digest = hashlib.sha256()
+    for func in EXTRACTORS:
+        digest.update(inspect.getsource(inspect.unwrap(func)).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def description_key(description, version):
+    """Hash the normalized description text together with the extractor version."""
+    normalized = re.sub(r"\s+", " ", str(description)).strip()
+    digest = hashlib.sha256(version.encode("utf-8"))
+    digest.update(normalized.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ExtractionCache:
+    """LRU cache of extraction results with an optional persistent SQLite tier."""
+
+    def __init__(self, max_size=10000, db_path=None):
+        self.max_size = max_size
+        self.version = extractor_version()
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS extraction_cache "
+                "(key TEXT PRIMARY KEY, version TEXT, result TEXT)"
+            )
+            # results of older extractors are useless, drop them
+            self._db.execute(
+                "DELETE FROM extraction_cache WHERE version != ?", (self.version,)
+            )
+            self._db.commit()
+
+    @property
+    def enabled(self):
+        return self.max_size > 0 or self._db is not None
+
+    def get(self, key):
+        """Return the cached result for the key (or None)."""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT result FROM extraction_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row:
+                    result = tuple(json.loads(row[0]))
+                    self._remember(key, result)
+                    self.hits += 1
+                    return result
+
+            self.misses += 1
+            return None
+
+    def put(self, key, result):
+        """Store the result in memory (and on disk if enabled)."""
+        with self._lock:
+            self._remember(key, result)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO extraction_cache VALUES (?, ?, ?)",
+                    (key, self.version, json.dumps(list(result))),
+                )
+                self._db.commit()
+
+    def _remember(self, key, result):
+        if self.max_size <= 0:
+            return
+        self._memory[key] = result
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+
+    def extract(self, description, parse=None, with_text=False):
+        """
+        Return (expectations, qualification, experience) for a description,
+        followed by its text if `with_text`. `parse` turns raw markup into a
+        tag, it is skipped when the result is cached.
+        """
+        key = None
+        result = None
+        if self.enabled:
+            key = description_key(description, self.version)
+            result = self.get(key)
+
+        if result is None:
+            job_desc = parse(description) if parse else description
+            # the extractors change the tag, so its text is read first
+            text = utils.get_text(job_desc)
+            result = tuple(utils.extract_description(job_desc)) + (text,)
+            if key is not None:
+                self.put(key, result)
+        return result if with_text else result[:3]
+
+    def stats(self):
+        """Return a short summary of cache effectiveness."""
+        total = self.hits + self.misses
+        ratio = self.hits / total * 100 if total else 0
+        return f"Extraction cache: {self.hits} hits, {self.misses} misses ({ratio:.1f}% hit rate)"
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+extraction_cache = ExtractionCache()
+
+
+def configure(max_size=10000, db_path=None):
+    """Replace the shared cache used by the scrapers."""
+    global extraction_cache
+    extraction_cache.close()
+    extraction_cache = ExtractionCache(max_size, db_path)
+    return extraction_cache
+
+
+def extract(description, parse=None, with_text=False):
+    """Extract details from a description using the shared cache."""
+    return extraction_cache.extract(description, parse, with_text)
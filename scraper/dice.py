@@ -5,28 +5,95 @@ A web scraper that extracts all jobs from dice.com
 import re
 import json
 import time
-import random
+import codecs
 import requests
+from html.parser import HTMLParser
 from datetime import datetime
 from bs4 import BeautifulSoup
 import concurrent.futures
 
 import utils
+import cache
+import archive
+import budget
+import egress
+import enrich
+import profiler
 
 
 session = requests.Session()
 
 
+class JobDescriptionParser(HTMLParser):
+    """
+    Incremental parser that copies the markup of the job description element
+    out of a detail page, so reading can stop as soon as the element is closed.
+    """
+
+    void_tags = set(
+        "area base br col embed hr img input link meta param source track wbr".split()
+    )
+
+    def __init__(self, element_id="jobdescSec"):
+        super().__init__(convert_charrefs=False)
+        self.element_id = element_id
+        self.parts = []
+        self.open_tags = []  # tags opened inside the job description
+        self.done = False
+
+    def handle_starttag(self, tag, attrs):
+        if self.done:
+            return
+        if self.open_tags:
+            self.parts.append(self.get_starttag_text())
+            if tag not in self.void_tags:
+                self.open_tags.append(tag)
+        elif tag == "div" and dict(attrs).get("id") == self.element_id:
+            self.parts.append(self.get_starttag_text())
+            self.open_tags.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        if self.open_tags and not self.done:
+            self.parts.append(self.get_starttag_text())
+
+    def handle_endtag(self, tag):
+        if not self.open_tags or self.done or tag not in self.open_tags:
+            return
+        self.parts.append(f"</{tag}>")
+        # close tags that were left open (like <p> or <li>) along the way
+        while self.open_tags.pop() != tag:
+            pass
+        self.done = not self.open_tags
+
+    def handle_data(self, data):
+        if self.open_tags and not self.done:
+            self.parts.append(data)
+
+    def handle_entityref(self, name):
+        self.handle_data(f"&{name};")
+
+    def handle_charref(self, name):
+        self.handle_data(f"&#{name};")
+
+    def markup(self):
+        return "".join(self.parts)
+
+
 class DiceScraper:
     """
     Scrape job posts from www.dice.com based on given keyword and return
     details about the jobs.
     """
 
+    site = "dice"
+    website = "www.dice.com"
+
     def __init__(self, query, location=""):
         self.query = query
         self.all_jobs = []
         self.filename = ""
+        self.saved_links = set()  # links of listed jobs, to not list them twice
+        self.queue = enrich.EnrichmentQueue(self.site)
         self.base_url = "https://job-search-api.svc.dhigroupinc.com/v1/dice/jobs/search"
 
         # this are obtanied from the cURL request the browser is making to the server
@@ -72,7 +139,9 @@ class DiceScraper:
         )
         return params
 
-    def get_salary(self, job, job_desc):
+    @staticmethod
+    @profiler.timed()
+    def get_salary(job, job_desc):
         """Extract salary information for the job posting (if any)."""
         pattern = r"(\$\d{2,}([,|.]?\d*|[k|K])\s?((-|to)\s?\$\d{2,}([,|.]?\d*|[k|K]))?)"
         salary = "0"
@@ -88,8 +157,8 @@ class DiceScraper:
             if salary == "0":
                 if re.search(pattern, job["title"]):
                     salary = re.search(pattern, job["title"]).group(0)
-                elif re.search(pattern, job_desc.text):
-                    salary = re.search(pattern, job_desc.text).group(0)
+                elif re.search(pattern, utils.get_text(job_desc)):
+                    salary = re.search(pattern, utils.get_text(job_desc)).group(0)
 
         salary = salary.strip().lower()
         salary = salary.replace("k", ",000")
@@ -100,7 +169,9 @@ class DiceScraper:
         salary = utils.clean_salary(salary)
         return salary
 
-    def is_remote_job(self, job, job_desc):
+    @staticmethod
+    @profiler.timed()
+    def is_remote_job(job, job_desc):
         """Checks if the job is remote or not."""
         # words that recruiters use to describe remote jobs
         pattern = r"\bWFH|100% remote|100% Remote/WFH|100% Remote / WFH|100% WFH|100% WFH/Remote|100% WFH / Remote\b"
@@ -108,13 +179,14 @@ class DiceScraper:
         if job["isRemote"]:
             return "Yes"
         else:
-            if re.search(pattern, job_desc.text, re.IGNORECASE):
+            if re.search(pattern, utils.get_text(job_desc), re.IGNORECASE):
                 return "Yes"
             if re.search(pattern, job["title"]):
                 return "Yes"
         return "No"
 
-    def get_job_location(self, job):
+    @staticmethod
+    def get_job_location(job):
         """Return address of the job (location and country)"""
         try:
             adress = job["jobLocation"]["displayName"].split(",")
@@ -134,37 +206,97 @@ class DiceScraper:
 
         return (location, country)
 
+    @staticmethod
+    def parse_job_description(content):
+        """Find the job description in the HTML of a job detail page."""
+        with profiler.section("parse"):
+            html = BeautifulSoup(content, "lxml")
+            return html.find("div", id="jobdescSec")
+
+    def read_job_description(self, r):
+        """
+        Read a streamed detail page until the job description is complete.
+        Returns the bytes that were read and the markup of the description.
+        """
+        content_type = r.headers.get("content-type", "")
+        encoding = r.encoding if "charset" in content_type else "utf-8"
+        decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+        parser = JobDescriptionParser()
+        chunks = []
+        try:
+            for chunk in r.iter_content(chunk_size=16 * 1024):
+                chunks.append(chunk)
+                with profiler.section("parse"):
+                    parser.feed(decoder.decode(chunk))
+                if parser.done:
+                    # the rest of the page (scripts, footer ...) is not needed
+                    break
+        finally:
+            r.close()
+
+        content = b"".join(chunks)
+        if parser.done:
+            return content, parser.markup()
+        return content, content.decode(encoding, errors="replace")
+
+    @staticmethod
+    def find_job_description(page):
+        """Return the markup of the job description in a detail page (or None)."""
+        parser = JobDescriptionParser()
+        with profiler.section("parse"):
+            parser.feed(page)
+        return parser.markup() if parser.done else None
+
     def get_job_description(self, job, timeout):
-        """Extract description of a job."""
+        """Return the markup of the description of a job (None if it failed)."""
         job_link = job["detailsPageUrl"]
-        time.sleep(2)
-        r = requests.get(job_link, headers=self.headers, timeout=timeout)
-
-        if r.status_code == 200:
-            # extract responsibility, skills_required ... from job description
-            html = BeautifulSoup(r.content, "lxml")
-            job_description = html.find("div", id="jobdescSec")
-            return job_description
-        else:
-            # failed to extract description of the job, use the job summary
-            return job["summary"]
+        budget.spend()
+        with profiler.section("fetch"):
+            r = session.get(
+                job_link, headers=self.headers, timeout=timeout, stream=True
+            )
+            if r.status_code != 200:
+                r.close()
+                return None
+            content, description = self.read_job_description(r)
+
+        archive.record("dice_detail", job_link, content, job=job)
+        return description
 
     def extract_job_detail(self, job, timeout):
         """Extract job description and other details for a job."""
+        # the pause is not part of the time it takes to extract the job
+        egress.pause(session, 2)
+        with profiler.section("extract_job_detail"):
+            description = self.get_job_description(job, timeout)
+            return self.get_job_detail(job, description)
+
+    @classmethod
+    def get_job_detail(cls, job, description):
+        """
+        Return details of a job from the search result and the markup of its
+        description (None if it could not be fetched).
+        It needs no scraper instance, so archived responses can be replayed.
+        """
         company = job["companyName"]
         title = job["title"]
         link = job["detailsPageUrl"]
-        location, country = self.get_job_location(job)
+        location, country = cls.get_job_location(job)
 
-        job_desc = self.get_job_description(job, timeout)
-
-        responsibility = utils.get_responsibility(job_desc)
-        qualification = utils.get_qualification(job_desc)
-        skills, experience = utils.get_skills_and_experience(job_desc)
-        expectations = f"{responsibility}\n{skills}"
+        parse = cls.parse_job_description
+        if description is None:
+            # failed to extract description of the job, use the job summary
+            description, parse = job["summary"], None
 
-        remote = self.is_remote_job(job, job_desc)
-        salary = self.get_salary(job, job_desc)
+        started = time.perf_counter()
+        # identical descriptions are parsed and extracted only once, their
+        # text is cached too so salary and remote work don't need the tag
+        expectations, qualification, experience, text = cache.extract(
+            description, parse, with_text=True
+        )
+        remote = cls.is_remote_job(job, text)
+        salary = cls.get_salary(job, text)
+        profiler.record_job(time.perf_counter() - started, link, description)
 
         return (
             company,
@@ -183,11 +315,9 @@ class DiceScraper:
         """Extract job details from a single search result page."""
         global session
 
-        params = self.get_params(page_num)
-        time.sleep(2)
-        r = session.get(self.base_url, headers=self.headers, params=params)
-        if r.status_code == 200:
-            result = json.loads(r.content)
+        egress.pause(session, 2)
+        result = self.search(page_num)
+        if result is not None:
             jobs = result["data"]
             print("Extracting jobs on page (", page_num, ")...")
 
@@ -204,7 +334,7 @@ class DiceScraper:
                     else:
                         self.all_jobs.append(job_detail)
 
-            utils.save_to_csv(self.all_jobs, self.filename)
+            utils.save_jobs(self.site, self.all_jobs, self.filename)
             self.all_jobs = []
 
     def extract_all_pages(self):
@@ -221,11 +351,9 @@ class DiceScraper:
             filename = f"{self.query}-job-list-dice-{today}.csv"
 
         self.filename = filename
-        params = self.get_params(current_page)
-        r = session.get(self.base_url, headers=self.headers, params=params)
+        result = self.search(current_page)
 
-        if r.status_code == 200:
-            result = json.loads(r.content)
+        if result is not None:
             jobs = result["data"]
             page_count = result["meta"]["pageCount"]
             print(f"Total pages to be scraped: {page_count} ( around 100 jobs in each)")
@@ -254,12 +382,159 @@ class DiceScraper:
 
                 if current_page % 10 == 0:
                     # wait some seconds to avoid overwhelming the server
-                    time.sleep(random.randint(20, 60))
+                    egress.pause(session, 20, 60)
 
-                time.sleep(random.randint(10, 20))
+                egress.pause(session, 10, 20)
         else:
             print("Error occurred while searching. Try again.")
 
         print(
             f"\nExtracted job listing is saved to Desktop with filename: {self.filename}\n"
         )
+
+    def search(self, page_num):
+        """Return the search API result for a page (or None if it failed)."""
+        global session
+
+        params = self.get_params(page_num)
+        budget.spend()
+        with profiler.section("fetch"):
+            r = session.get(self.base_url, headers=self.headers, params=params)
+        if r.status_code != 200:
+            return None
+        archive.record("dice_search", r.url, r.content, page=page_num)
+        with profiler.section("parse"):
+            return json.loads(r.content)
+
+    def get_listing_detail(self, job):
+        """Return the details of a job that are available without its description."""
+        location, country = self.get_job_location(job)
+        # the summary stands in for the description until the job is enriched
+        summary = job.get("summary", "")
+
+        return (
+            job["companyName"],
+            job["title"],
+            self.get_salary(job, summary),
+            location,
+            country,
+            "",
+            "",
+            "",
+            self.is_remote_job(job, summary),
+            job["detailsPageUrl"],
+        )
+
+    def list_page(self, page_num):
+        """
+        Save the jobs on a result page that are not saved yet and queue them
+        for enrichment. Returns the number of result pages (None if it failed).
+        """
+        result = self.search(page_num)
+        if result is None:
+            return None
+
+        page_count = result["meta"]["pageCount"]
+        print(f"Listing jobs on page ( {page_num} / {page_count} )...")
+        rows, listed = [], []
+        for job in result["data"]:
+            try:
+                row = self.get_listing_detail(job)
+            except KeyError:
+                continue
+            if row[-1] not in self.saved_links:
+                rows.append(row)
+                listed.append(job)
+
+        # the rows must be saved before their jobs can be enriched (upserted)
+        utils.save_jobs(self.site, rows, self.filename)
+        self.saved_links.update(row[-1] for row in rows)
+        for job in listed:
+            posted = job.get("postedDate", "")
+            self.queue.add(job["id"], job, self.filename, posted)
+        self.queue.save()
+        return page_count
+
+    def list_all_pages(self):
+        """
+        Save every job on all result pages using only the search API and queue
+        them for description enrichment.
+        """
+        progress = utils.get_progress(self.query, 1, "listing")
+        if progress:
+            current_page, filename = progress
+        else:
+            current_page = 1
+            today = datetime.today().strftime("%Y-%m-%d")
+            filename = f"{self.query}-job-list-dice-{today}.csv"
+
+        self.filename = filename
+        self.saved_links = utils.get_saved_links(filename)
+        page_count = current_page
+        if budget.run_budget.limited and current_page > 1 and not budget.exhausted():
+            # new postings show up on the first page, so it is listed again
+            # before resuming, otherwise a short run would never reach them
+            print("Listing the first page again for new jobs...")
+            page_count = self.list_page(1) or current_page
+            egress.pause(session, 2)
+
+        while current_page <= page_count:
+            if budget.exhausted():
+                print("\nThe budget of this run is used up. Run again to continue.")
+                break
+            page_count = self.list_page(current_page)
+            if page_count is None:
+                print("Error occurred while searching. Try again.")
+                break
+
+            current_page += 1
+            utils.save_progress(current_page, self.filename, 1, "listing")
+            egress.pause(session, 2)
+
+        print(f"\nJob listing is saved to Desktop with filename: {self.filename}")
+        print(f"{len(self.queue)} jobs are waiting for their description.\n")
+
+    def enrich_pending(self, until=None):
+        """
+        Fetch and extract descriptions of queued jobs, newest first, and update
+        their rows. When `until` (an Event) is given, wait for more jobs until it is set.
+        """
+        while not budget.exhausted():
+            finished = until is None or until.is_set()
+            batch = self.queue.next_batch(budget.batch_size(50))
+            if not batch:
+                if finished:
+                    break
+                time.sleep(5)
+                continue
+
+            enriched = {}
+            done, failed = [], []
+            with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
+                future_to_job = {
+                    executor.submit(self.extract_job_detail, entry["job"], 120): (
+                        job_id,
+                        entry,
+                    )
+                    for job_id, entry in batch
+                }
+                for future in concurrent.futures.as_completed(future_to_job):
+                    job_id, entry = future_to_job[future]
+                    try:
+                        job_detail = future.result()
+                    except:
+                        failed.append(job_id)
+                    else:
+                        enriched.setdefault(entry["filename"], []).append(job_detail)
+                        done.append(job_id)
+
+            for filename, job_list in enriched.items():
+                utils.save_jobs(self.site, job_list, filename, upsert=True)
+            self.queue.done(done)
+            self.queue.failed(failed)
+            print(f"Enriched {len(done)} jobs ({len(self.queue)} left)...")
+
+        if budget.exhausted():
+            print(
+                f"\nThe budget of this run is used up, {len(self.queue)} jobs are left."
+            )
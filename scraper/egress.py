@@ -0,0 +1,181 @@
+"""
+A pool of egresses (proxies or local source addresses) to spread requests over.
+
+Every egress has its own session (connection pool) and request rate, and keeps
+track of its latency, error and block rates. Requests go to a healthy egress
+picked at random, weighted by its health, and egresses that keep failing or
+getting blocked are quarantined for a while.
+"""
+
+import time
+import random
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+import budget
+import profiler
+
+
+# responses that mean the website is throttling or blocking the egress
+BLOCKED_STATUS = (403, 429)
+
+
+class SourceAddressAdapter(HTTPAdapter):
+    """Transport adapter that sends requests from the given local address."""
+
+    def __init__(self, source_address, **kwargs):
+        self.source_address = (source_address, 0)
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["source_address"] = self.source_address
+        super().init_poolmanager(*args, **kwargs)
+
+    def proxy_manager_for(self, *args, **kwargs):
+        kwargs["source_address"] = self.source_address
+        return super().proxy_manager_for(*args, **kwargs)
+
+
+class Egress:
+    """A single way out to the internet, with its own session, rate and health."""
+
+    alpha = 0.2  # weight of the latest request in the moving averages
+
+    def __init__(self, proxy=None, source_address=None, rate=1.0):
+        self.name = proxy or source_address or "direct"
+        self.interval = 1 / rate if rate > 0 else 0
+        self.session = requests.Session()
+        if proxy:
+            self.session.proxies = {"http": proxy, "https": proxy}
+        if source_address:
+            adapter = SourceAddressAdapter(source_address, pool_maxsize=10)
+            self.session.mount("http://", adapter)
+            self.session.mount("https://", adapter)
+
+        self.requests = 0
+        self.latency = 1.0  # seconds, moving average
+        self.error_rate = 0.0
+        self.block_rate = 0.0
+        self.strikes = 0
+        self.quarantined_until = 0
+        self._next_slot = 0
+        self._lock = threading.Lock()
+
+    def weight(self):
+        """How much this egress should be preferred over the others."""
+        health = (1 - self.error_rate) * (1 - self.block_rate)
+        return max(health / max(self.latency, 0.05), 0.01)
+
+    def is_available(self, now):
+        return now >= self.quarantined_until
+
+    def wait_turn(self):
+        """Sleep until the egress may send another request within its rate."""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    def record(self, latency, status=None, error=False):
+        """Update the health of the egress after a request."""
+        blocked = status in BLOCKED_STATUS
+        failed = error or (status is not None and status >= 500)
+        with self._lock:
+            self.requests += 1
+            self.latency += self.alpha * (latency - self.latency)
+            self.error_rate += self.alpha * (failed - self.error_rate)
+            self.block_rate += self.alpha * (blocked - self.block_rate)
+            return self.requests >= 3 and max(self.error_rate, self.block_rate) > 0.5
+
+    def quarantine(self, seconds):
+        """Stop using the egress for a while, longer each time it happens."""
+        with self._lock:
+            duration = min(seconds * 2**self.strikes, 3600)
+            self.quarantined_until = time.monotonic() + duration
+            self.strikes += 1
+            # start again on probation once the quarantine is over
+            self.error_rate = min(self.error_rate, 0.25)
+            self.block_rate = min(self.block_rate, 0.25)
+            return duration
+
+
+class EgressPool:
+    """Send requests through a pool of egresses, like a requests.Session."""
+
+    def __init__(self, egresses, quarantine_seconds=300):
+        self.egresses = list(egresses)
+        self.quarantine_seconds = quarantine_seconds
+
+    def __len__(self):
+        return len(self.egresses)
+
+    def available(self):
+        now = time.monotonic()
+        return [egress for egress in self.egresses if egress.is_available(now)]
+
+    def choose(self):
+        """Pick a healthy egress, weighted by health (waits if all are quarantined)."""
+        available = self.available()
+        if not available:
+            egress = min(self.egresses, key=lambda egress: egress.quarantined_until)
+            time.sleep(max(egress.quarantined_until - time.monotonic(), 0))
+            return egress
+        weights = [egress.weight() for egress in available]
+        return random.choices(available, weights=weights)[0]
+
+    def request(self, method, url, **kwargs):
+        egress = self.choose()
+        egress.wait_turn()
+        started = time.monotonic()
+        try:
+            r = egress.session.request(method, url, **kwargs)
+        except requests.RequestException:
+            unhealthy = egress.record(time.monotonic() - started, error=True)
+            self._check(egress, unhealthy)
+            raise
+
+        unhealthy = egress.record(time.monotonic() - started, r.status_code)
+        self._check(egress, unhealthy)
+        return r
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def _check(self, egress, unhealthy):
+        if unhealthy and len(self.available()) > 1:
+            duration = egress.quarantine(self.quarantine_seconds)
+            print(f"Egress {egress.name} is quarantined for {int(duration)} seconds")
+
+    def report(self):
+        """Return the health of every egress."""
+        lines = []
+        for egress in self.egresses:
+            lines.append(
+                f"{egress.name}: {egress.requests} requests, "
+                f"{egress.latency:.2f}s latency, {egress.error_rate:.0%} errors, "
+                f"{egress.block_rate:.0%} blocked, quarantined {egress.strikes} times"
+            )
+        return "\n".join(lines)
+
+
+def create_pool(proxies=(), source_addresses=(), rate=1.0):
+    """Create a pool from proxy URLs and local addresses (None if both are empty)."""
+    egresses = [Egress(proxy=proxy, rate=rate) for proxy in proxies]
+    egresses += [Egress(source_address=ip, rate=rate) for ip in source_addresses]
+    return EgressPool(egresses) if egresses else None
+
+
+def pause(session, low, high=None):
+    """
+    Sleep between requests to avoid being blocked. The sleep is shorter when
+    requests are spread over a pool, since every egress sends fewer of them.
+    """
+    seconds = random.randint(low, high) if high is not None else low
+    if isinstance(session, EgressPool):
+        seconds /= max(len(session.available()), 1)
+    # never wait past the end of the budget of the run
+    with profiler.section("throttle"):
+        time.sleep(budget.clamp(seconds))
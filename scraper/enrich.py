@@ -0,0 +1,109 @@
+"""
+A persistent queue of jobs that were saved from the listing pages only and
+still need their description fetched and extracted.
+
+The queue is saved to the home directory after every change, so an
+interrupted enrichment pass continues where it left off on the next run.
+"""
+
+import os
+import json
+import threading
+
+import utils
+
+
+class EnrichmentQueue:
+    """Jobs waiting for description enrichment, highest priority first."""
+
+    max_attempts = 3
+
+    def __init__(self, site):
+        self.site = site
+        self.path = os.path.join(utils.get_home_dir(), f".{site}_enrich_queue.json")
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._in_progress = set()
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as file:
+                self._jobs = json.load(file)
+
+        # jobs enriched by earlier runs, new postings go before them
+        self.seen_path = os.path.join(utils.get_home_dir(), f".{site}_seen_jobs.txt")
+        self._seen = set()
+        if os.path.exists(self.seen_path):
+            with open(self.seen_path, encoding="utf-8") as file:
+                self._seen = set(file.read().split())
+
+    def __len__(self):
+        with self._lock:
+            return len(self._jobs)
+
+    def _save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(self._jobs, file)
+        os.replace(tmp_path, self.path)
+
+    def add(self, job_id, job, filename, priority=""):
+        """
+        Queue a job (the data needed to enrich it) for the given CSV file.
+        Jobs with a higher priority (e.g. a more recent posted date) go first.
+        """
+        with self._lock:
+            self._jobs[job_id] = {
+                "job": job,
+                "filename": filename,
+                "priority": priority,
+                "seen": job_id in self._seen,
+                "attempts": 0,
+            }
+
+    def save(self):
+        """Write the queue to disk."""
+        with self._lock:
+            self._save()
+
+    def next_batch(self, size):
+        """Take the highest priority jobs that are not being enriched already."""
+        with self._lock:
+            pending = [
+                (job_id, entry)
+                for job_id, entry in self._jobs.items()
+                if job_id not in self._in_progress
+            ]
+            # newest first, then the ones that were never enriched before
+            pending.sort(
+                key=lambda item: (item[1]["priority"], not item[1].get("seen")),
+                reverse=True,
+            )
+            batch = pending[:size]
+            self._in_progress.update(job_id for job_id, _ in batch)
+            return batch
+
+    def done(self, job_ids):
+        """Remove enriched jobs from the queue."""
+        with self._lock:
+            for job_id in job_ids:
+                self._jobs.pop(job_id, None)
+                self._in_progress.discard(job_id)
+            self._save()
+
+            new_ids = [job_id for job_id in job_ids if job_id not in self._seen]
+            self._seen.update(new_ids)
+            if new_ids:
+                with open(self.seen_path, "a", encoding="utf-8") as file:
+                    file.write("".join(f"{job_id}\n" for job_id in new_ids))
+
+    def failed(self, job_ids):
+        """Put jobs back in the queue, giving up after a few attempts."""
+        with self._lock:
+            for job_id in job_ids:
+                self._in_progress.discard(job_id)
+                entry = self._jobs.get(job_id)
+                if entry is None:
+                    continue
+                entry["attempts"] += 1
+                if entry["attempts"] >= self.max_attempts:
+                    del self._jobs[job_id]
+            self._save()
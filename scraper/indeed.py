@@ -5,12 +5,17 @@ A web scraper that extract all jobs from indeed.com
 import re
 import time
 import json
-import random
 import requests
 from datetime import datetime
 from bs4 import BeautifulSoup
 
 import utils
+import cache
+import archive
+import budget
+import egress
+import enrich
+import profiler
 
 
 session = requests.Session()
@@ -19,13 +24,19 @@ session = requests.Session()
 class IndeedScraper:
     """Scrape Job posts from www.indeed.com."""
 
+    site = "indeed"
+    website = "www.indeed.com"
+    base_url = "https://www.indeed.com"
+
     def __init__(self, query, location=""):
         self.query = query
         self.location = location
-        self.base_url = "https://www.indeed.com"
         self.url = f"{self.base_url}/jobs?q={self.query}&l={location}&limit=50"
         self.all_jobs = {}
         self.filename = ""
+        self.listing_only = False  # skip descriptions, queue them for enrichment
+        self.saved_links = set()  # links of listed jobs, to not list them twice
+        self.queue = enrich.EnrichmentQueue(self.site)
 
         self.headers = {
             "authority": "www.indeed.com",
@@ -42,48 +53,89 @@ class IndeedScraper:
             "accept-language": "en-US,en;q=0.9,am;q=0.8",
         }
 
-    def get_descriptions(self, job_keys):
-        """Get job description of all jobs on a single page."""
+    def get_descriptions(self, job_keys, jobs=None):
+        """
+        Get job description of all jobs on a single page. `jobs` (job details by
+        job key) is archived with the response so it can be replayed later.
+        """
         try:
             params = (("jks", ",".join(job_keys)),)
-            r = session.get(
-                "https://www.indeed.com/rpc/jobdescs",
-                headers=self.headers,
-                params=params,
-            )
-            if r.status_code == 200:
-                return json.loads(r.content)
-            else:
-                print("(Retrying after 10 sec)...")
-                time.sleep(10)
+            budget.spend()
+            with profiler.section("fetch"):
                 r = session.get(
                     "https://www.indeed.com/rpc/jobdescs",
                     headers=self.headers,
                     params=params,
                 )
-                return json.loads(r.content) if r.status_code == 200 else None
+            if r.status_code != 200 and not budget.exhausted():
+                print("(Retrying after 10 sec)...")
+                egress.pause(session, 10)
+                budget.spend()
+                with profiler.section("fetch"):
+                    r = session.get(
+                        "https://www.indeed.com/rpc/jobdescs",
+                        headers=self.headers,
+                        params=params,
+                    )
+            if r.status_code == 200:
+                archive.record("indeed_jobdescs", r.url, r.content, jobs=jobs or {})
+                with profiler.section("parse"):
+                    return json.loads(r.content)
+            return None
         except:
             print("It seems your Internet connection is slower. Try again later.")
             return None
 
+    @classmethod
+    def get_full_detail(cls, job_detail, job_desc):
+        """Add the details extracted from a job description to the job detail."""
+        more_detail = cls.get_more_detail(job_desc, job_detail[-1])
+        return cls.add_more_detail(job_detail, more_detail)
+
+    @staticmethod
+    def add_more_detail(job_detail, more_detail):
+        """Put the details from a job description in their columns of the row."""
+        return job_detail[:5] + list(more_detail) + job_detail[5:]
+
+    @classmethod
+    def get_more_detail(cls, job_desc, link=""):
+        """Return expectations, qualification and experience of a job description."""
+        if not job_desc:
+            # failed to extract job description
+            return ["None", "None", "None"]
+
+        started = time.perf_counter()
+        # identical descriptions are parsed and extracted once
+        more_detail = list(cache.extract(job_desc, cls.parse_description))
+        profiler.record_job(time.perf_counter() - started, link, job_desc)
+        return more_detail
+
+    @staticmethod
+    def parse_description(job_desc):
+        """Parse the HTML of a job description returned by /rpc/jobdescs."""
+        with profiler.section("parse"):
+            return BeautifulSoup(job_desc, "lxml").find("body")
+
     def get_similar_jobs(self, start_url):
         """Extract similar jobs in other locations starting from the given url."""
 
+        if budget.exhausted():
+            return
         print("Extracting similar jobs...")
         start_url += "&filter=0"
         current_page = self.extract_page(start_url)
-        time.sleep(random.randint(5, 10))
+        egress.pause(session, 5, 10)
         page = 1
         if current_page:
-            while True:
+            while not budget.exhausted():
                 try:
                     next_page = current_page.find("a", {"aria-label": "Next"})
                     next_url = f"https://www.indeed.com{next_page.get('href')}"
                     current_page = self.extract_page(next_url)
                     page += 1
-                    time.sleep(random.randint(5, 10))
+                    egress.pause(session, 5, 10)
                     if page % 4 == 0:
-                        time.sleep(random.randint(60, 90))
+                        egress.pause(session, 60, 90)
                 except AttributeError:
                     print("Finished.")
                     break
@@ -93,6 +145,24 @@ class IndeedScraper:
     def get_job_detail(self, job):
         """Extract job detail for a single job post."""
 
+        more_loc = job.find("span", class_="more_loc_container")
+        if more_loc:
+            more_loc_link = self.base_url + more_loc.find("a").attrs.get("href")
+            self.get_similar_jobs(more_loc_link)
+            return None
+
+        return self.parse_job(job, self.location)
+
+    @classmethod
+    def parse_job(cls, job, search_location=""):
+        """
+        Return (job key, job detail) of a job post on a result page, without
+        fetching anything, so archived result pages can be extracted again.
+        Returns None for jobs posted in several locations.
+        """
+        if job.find("span", class_="more_loc_container"):
+            return None
+
         company = job.find("span", class_="companyName").text.strip()
         title = job.find("h2", "jobTitle").contents[-1].text.strip()
         salary = "0"
@@ -105,18 +175,12 @@ class IndeedScraper:
             salary = "0"
 
         location = job.find("div", class_="companyLocation").text.strip()
-        more_loc = job.find("span", class_="more_loc_container")
-        if more_loc:
-            more_loc_link = self.base_url + more_loc.find("a").attrs.get("href")
-            self.get_similar_jobs(more_loc_link)
-            return None
-
         location = re.sub(r"(\+\d+ location[s]?)", "", location)
         location = location.replace("•", " or ")
         if location.lower() == "remote":
             country = "Remote"
         else:
-            country = self.location if self.location else "USA"
+            country = search_location if search_location else "USA"
         remote = "Yes" if "remote" in location.lower() else "No"
         job_key = ""
         href = job.attrs.get("href")
@@ -124,70 +188,90 @@ class IndeedScraper:
             job_key = href.split("?")[-1].split("&")[0].split("=")[-1]
         elif "?fccid=" in href:
             job_key = href.split("?")[0].split("-")[-1]
-        link = f"{self.base_url}/viewjob?jk={job_key}" if job_key else ""
+        link = f"{cls.base_url}/viewjob?jk={job_key}" if job_key else ""
 
         return (job_key, [company, title, salary, location, country, remote, link])
 
+    @staticmethod
+    def find_jobs(content):
+        """Parse a result page, return the page and the job posts on it."""
+        with profiler.section("parse"):
+            current_page = BeautifulSoup(content, "lxml")
+            return current_page, current_page.find_all("a", class_="tapItem")
+
+    def get_posted_days(self, job):
+        """Return how many days ago the job was posted (30 if unknown)."""
+        try:
+            posted = job.find("span", class_="date").text.strip().lower()
+        except AttributeError:
+            return 30
+        if "today" in posted or "just posted" in posted:
+            return 0
+        match = re.search(r"(\d+)", posted)
+        return int(match.group(1)) if match else 30
+
+    def save_listing(self, posted_days):
+        """Save jobs on the current page without description and queue them."""
+        new_jobs = {
+            job_key: job_detail
+            for job_key, job_detail in self.all_jobs.items()
+            if job_detail[-1] not in self.saved_links
+        }
+        rows = [
+            self.add_more_detail(job_detail, ["", "", ""])
+            for job_detail in new_jobs.values()
+        ]
+        # the rows must be saved before their jobs can be enriched (upserted)
+        utils.save_jobs(self.site, rows, self.filename)
+        self.saved_links.update(row[-1] for row in rows)
+
+        for job_key, job_detail in new_jobs.items():
+            # the most recent jobs are enriched first
+            priority = -posted_days.get(job_key, 30)
+            self.queue.add(job_key, job_detail, self.filename, priority)
+        self.queue.save()
+        self.all_jobs = {}
+
     def extract_page(self, url):
         """Extract details of jobs on a single page."""
 
         global session
 
         try:
-            r = session.get(
-                url,
-                headers=self.headers,
-            )
+            budget.spend()
+            with profiler.section("fetch"):
+                r = session.get(
+                    url,
+                    headers=self.headers,
+                )
             if r.status_code == 200:
-                current_page = BeautifulSoup(r.content, "lxml")
-                jobs = current_page.find_all("a", class_="tapItem")
+                # the search location is needed to extract the page again
+                archive.record("indeed_page", url, r.content, location=self.location)
+                current_page, jobs = self.find_jobs(r.content)
 
+                posted_days = {}
                 for job in jobs:
                     if self.get_job_detail(job):
                         job_key, job_detail = self.get_job_detail(job)
                         self.all_jobs[job_key] = job_detail
+                        posted_days[job_key] = self.get_posted_days(job)
+
+                if self.listing_only:
+                    self.save_listing(posted_days)
+                    return current_page
 
                 job_keys = list(self.all_jobs.keys())
 
-                time.sleep(random.randint(5, 10))
-                descriptions = self.get_descriptions(job_keys)
-
-                if descriptions:
-                    for job_key, job_detail in self.all_jobs.items():
-                        try:
-                            job_desc = descriptions[job_key]
-                            if job_desc:
-                                job_desc = BeautifulSoup(job_desc, "lxml").find("body")
-                                responsibility = utils.get_responsibility(job_desc)
-                                qualification = utils.get_qualification(job_desc)
-                                skills, experience = utils.get_skills_and_experience(
-                                    job_desc
-                                )
-                                expectations = f"{responsibility}\n{skills}"
-
-                                more_detail = [expectations, qualification, experience]
-                                new_job_detail = (
-                                    job_detail[:5] + more_detail + job_detail[5:]
-                                )
-                                self.all_jobs[job_key] = new_job_detail
-                            else:
-                                # failed to extract job description
-                                new_job_detail = (
-                                    job_detail[:5]
-                                    + ["None", "None", "None"]
-                                    + job_detail[5:]
-                                )
-                                self.all_jobs[job_key] = new_job_detail
-                        except:
-                            pass
-                else:
-                    for job_key, job_detail in self.all_jobs.items():
-                        new_job_detail = (
-                            job_detail[:5] + ["None", "None", "None"] + job_detail[5:]
-                        )
-                        self.all_jobs[job_key] = new_job_detail
-
-                utils.save_to_csv(self.all_jobs, self.filename)
+                egress.pause(session, 5, 10)
+                descriptions = self.get_descriptions(job_keys, self.all_jobs)
+
+                descriptions = descriptions or {}
+                for job_key, job_detail in self.all_jobs.items():
+                    self.all_jobs[job_key] = self.get_full_detail(
+                        job_detail, descriptions.get(job_key)
+                    )
+
+                utils.save_jobs(self.site, self.all_jobs, self.filename)
                 self.all_jobs = {}
                 return current_page
             else:
@@ -200,9 +284,10 @@ class IndeedScraper:
 
         global session
 
-        if utils.get_progress(self.query, 2):
+        phase = "listing" if self.listing_only else "scraper"
+        if utils.get_progress(self.query, 2, phase):
             # already saved file found, append to it
-            page_num, filename = utils.get_progress(self.query, 2)
+            page_num, filename = utils.get_progress(self.query, 2, phase)
         else:
             # save to a new file
             page_num = 1
@@ -210,15 +295,24 @@ class IndeedScraper:
             filename = f"{self.query}-job-list-indeed-{today}.csv"
 
         self.filename = filename
+        if self.listing_only:
+            self.saved_links = utils.get_saved_links(filename)
+
+        if budget.exhausted():
+            print("\nThe budget of this run is used up. Run again to continue.")
+            return
 
         print(f"Extracting jobs on page [ {page_num} ]...")
         start_url = f"{self.url}&start={(page_num-1)*50}"
         current_page = self.extract_page(start_url)
-        utils.save_progress(page_num + 1, self.filename, 2)
-        time.sleep(random.randint(5, 10))
+        utils.save_progress(page_num + 1, self.filename, 2, phase)
+        egress.pause(session, 5, 10)
 
         if current_page:
             while True:
+                if budget.exhausted():
+                    print("\nThe budget of this run is used up. Run again to continue.")
+                    break
                 try:
                     next_page = current_page.find("a", {"aria-label": "Next"})
                     next_url = f"https://www.indeed.com{next_page.get('href')}"
@@ -227,11 +321,11 @@ class IndeedScraper:
                     current_page = self.extract_page(next_url)
 
                     # Throttling the request to avoid being blocked by the server
-                    time.sleep(random.randint(5, 10))
+                    egress.pause(session, 5, 10)
                     if page_num % 5 == 0:
-                        time.sleep(random.randint(60, 90))
+                        egress.pause(session, 60, 90)
 
-                    utils.save_progress(page_num + 1, self.filename, 2)
+                    utils.save_progress(page_num + 1, self.filename, 2, phase)
                 except AttributeError:
                     print("\n\nFinished extracting all result pages.")
                     break
@@ -241,3 +335,71 @@ class IndeedScraper:
         print(
             f"\nExtracted job listing is saved to Desktop with filename: {self.filename}\n"
         )
+
+    def list_newest_jobs(self):
+        """
+        List the newest jobs again before resuming an earlier listing, since a
+        short run would otherwise never get back to them.
+        """
+        progress = utils.get_progress(self.query, 2, "listing")
+        if not progress or progress[0] == 1 or budget.exhausted():
+            return
+        self.filename = progress[1]
+        self.saved_links = utils.get_saved_links(self.filename)
+        print("Listing the newest jobs again...")
+        self.extract_page(f"{self.url}&sort=date")
+        egress.pause(session, 5, 10)
+
+    def list_all_pages(self):
+        """
+        Save every job on all result pages without fetching descriptions and
+        queue them for enrichment.
+        """
+        self.listing_only = True
+        try:
+            if budget.run_budget.limited:
+                self.list_newest_jobs()
+            self.extract_all_pages()
+        finally:
+            self.listing_only = False
+        print(f"{len(self.queue)} jobs are waiting for their description.\n")
+
+    def enrich_pending(self, until=None):
+        """
+        Fetch and extract descriptions of queued jobs, newest first, and update
+        their rows. When `until` (an Event) is given, wait for more jobs until it is set.
+        """
+        while not budget.exhausted():
+            finished = until is None or until.is_set()
+            batch = self.queue.next_batch(budget.batch_size(50))
+            if not batch:
+                if finished:
+                    break
+                time.sleep(5)
+                continue
+
+            jobs = {job_key: entry["job"] for job_key, entry in batch}
+            descriptions = self.get_descriptions(list(jobs), jobs)
+            if not descriptions:
+                self.queue.failed([job_key for job_key, _ in batch])
+                egress.pause(session, 5, 10)
+                continue
+
+            enriched = {}
+            for job_key, entry in batch:
+                job_desc = descriptions.get(job_key)
+                new_job_detail = self.get_full_detail(entry["job"], job_desc)
+                enriched.setdefault(entry["filename"], []).append(new_job_detail)
+
+            for filename, job_list in enriched.items():
+                utils.save_jobs(self.site, job_list, filename, upsert=True)
+            self.queue.done([job_key for job_key, _ in batch])
+            print(f"Enriched {len(batch)} jobs ({len(self.queue)} left)...")
+
+            # Throttling the request to avoid being blocked by the server
+            egress.pause(session, 5, 10)
+
+        if budget.exhausted():
+            print(
+                f"\nThe budget of this run is used up, {len(self.queue)} jobs are left."
+            )
@@ -0,0 +1,95 @@
+"""
+One CSV file for jobs scraped from several websites at the same time.
+
+Rows from every site are normalized and de-duplicated by company, title and
+location, since the same job is often posted on more than one website. Only
+rows from different websites are dropped, a website can list several jobs
+with the same company, title and location (with different links).
+"""
+
+import os
+import re
+import csv
+import threading
+
+import utils
+
+
+COMPANY_SUFFIXES = r"\b(inc|llc|ltd|corp|corporation|co|company|group)\b"
+
+
+def normalize_text(text):
+    """Collapse whitespace and remove bullets from a field."""
+    text = str(text).replace("\xa0", " ").replace("•", "")
+    return re.sub(r"[ \t]+", " ", text).strip()
+
+
+def get_dedup_key(row):
+    """Return the key that identifies the same job on different websites."""
+    company = re.sub(COMPANY_SUFFIXES, "", row[0].lower())
+    title = row[1].lower()
+    location = re.sub(r"^remote or ", "", row[3].lower())
+    return tuple(
+        re.sub(r"[^a-z0-9]+", " ", text).strip() for text in (company, title, location)
+    )
+
+
+class MergedWriter:
+    """Collect jobs from all scrapers into a single de-duplicated CSV file."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.path = utils.get_desktop_path(filename)
+        self._rows = {}  # (dedup key, link) -> row
+        self._sites = {}  # dedup key -> site the job was kept from
+        self._skipped = set()  # (site, link) of jobs kept from another site
+        self._lock = threading.Lock()
+
+        if os.path.exists(self.path):
+            # continue an earlier run that was interrupted
+            with open(self.path, newline="", encoding="utf-8") as file:
+                for row in list(csv.reader(file))[1:]:
+                    key = get_dedup_key(row[1:])
+                    self._sites.setdefault(key, row[0])
+                    self._rows[key + (row[-1],)] = row
+
+    @property
+    def duplicates(self):
+        """Number of jobs skipped because they were kept from another website."""
+        with self._lock:
+            return len(self._skipped)
+
+    def add(self, site, job_list):
+        """Add a batch of rows saved by one of the scrapers."""
+        new_rows = []
+        changed = False
+        with self._lock:
+            for row in job_list:
+                row = [site] + [normalize_text(field) for field in row]
+                key = get_dedup_key(row[1:])
+                if self._sites.setdefault(key, site) != site:
+                    # posted on another website too, which was saved first
+                    self._skipped.add((site, row[-1]))
+                    continue
+
+                existing = self._rows.get(key + (row[-1],))
+                if existing is None:
+                    new_rows.append(row)
+                else:
+                    # the same job again, e.g. after its description was enriched
+                    changed = changed or existing != row
+                self._rows[key + (row[-1],)] = row
+
+            if changed:
+                self._write(self._rows.values(), "w")
+            elif new_rows:
+                self._write(new_rows, "a")
+
+    def _write(self, rows, mode):
+        if mode == "a" and not os.path.exists(self.path):
+            mode = "w"
+        with open(self.path, mode=mode, newline="", encoding="utf-8") as file:
+            csv_writer = csv.writer(file)
+            if mode == "w":
+                csv_writer.writerow(("Site",) + utils.FIELDS)
+            csv_writer.writerows(rows)
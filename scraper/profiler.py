@@ -0,0 +1,175 @@
+"""
+A lightweight deterministic profiler for the fetch/parse/extract hot path.
+
+Sections are timed with `section()` (or the `timed()` decorator) and
+aggregated into collapsed stacks that flamegraph.pl / speedscope understand.
+Profiling is off by default and costs almost nothing until `enable()` is called.
+"""
+
+import os
+import time
+import threading
+import functools
+from collections import defaultdict
+
+
+_enabled = False
+_lock = threading.Lock()
+_local = threading.local()
+
+_self_time = defaultdict(float)  # collapsed stack -> self time (seconds)
+_total_time = defaultdict(float)  # section name -> inclusive time (seconds)
+_calls = defaultdict(int)  # section name -> number of calls
+_job_costs = []  # (seconds, link, description) for every extracted job
+
+
+def enable():
+    """Turn profiling on and clear previously collected data."""
+    global _enabled
+    reset()
+    _enabled = True
+
+
+def is_enabled():
+    """Check whether profiling is turned on."""
+    return _enabled
+
+
+def reset():
+    """Forget everything collected so far."""
+    with _lock:
+        _self_time.clear()
+        _total_time.clear()
+        _calls.clear()
+        _job_costs.clear()
+
+
+class _Section:
+    """Context manager that times a named section of code."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        if not _enabled:
+            return self
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+        # each frame is [name, start time, time spent in child sections]
+        stack.append([self.name, time.perf_counter(), 0.0])
+        return self
+
+    def __exit__(self, *exc):
+        stack = getattr(_local, "stack", None)
+        if not _enabled or not stack:
+            return False
+
+        name, started, child_time = stack[-1]
+        elapsed = time.perf_counter() - started
+        collapsed = ";".join(frame[0] for frame in stack)
+        stack.pop()
+        if stack:
+            stack[-1][2] += elapsed
+
+        with _lock:
+            _self_time[collapsed] += elapsed - child_time
+            _total_time[name] += elapsed
+            _calls[name] += 1
+        return False
+
+
+def section(name):
+    """Time the code inside a `with` block under the given name."""
+    return _Section(name)
+
+
+def timed(name=None):
+    """Decorator that times every call of a function as a section."""
+
+    def decorator(func):
+        label = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Section(label):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def record_job(seconds, link, job_desc):
+    """Remember how long it took to extract details from one job description."""
+    if not _enabled:
+        return
+    # keep the raw markup so slow inputs can be saved as fixtures later
+    description = str(job_desc) if job_desc is not None else ""
+    with _lock:
+        _job_costs.append((seconds, link, description))
+
+
+def write_collapsed_stacks(path):
+    """Write collected samples in collapsed-stack format (values in microseconds)."""
+    with _lock:
+        lines = [
+            f"{stack} {int(seconds * 1_000_000)}"
+            for stack, seconds in sorted(_self_time.items())
+            if seconds > 0
+        ]
+    with open(path, "w", encoding="utf-8") as file:
+        file.write("\n".join(lines) + "\n")
+
+
+def slowest_jobs(top=10):
+    """Return the job descriptions that took the longest to extract."""
+    with _lock:
+        return sorted(_job_costs, key=lambda cost: cost[0], reverse=True)[:top]
+
+
+def save_fixtures(directory, top=10):
+    """Save the costliest job descriptions as HTML files for later debugging."""
+    os.makedirs(directory, exist_ok=True)
+    saved = []
+    for rank, (seconds, link, description) in enumerate(slowest_jobs(top), start=1):
+        path = os.path.join(directory, f"slow-job-{rank:02d}.html")
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(f"<!-- {link} ({seconds * 1000:.1f} ms) -->\n")
+            file.write(description)
+        saved.append(path)
+    return saved
+
+
+def report(top=15):
+    """Return a human readable summary of where the time went."""
+    with _lock:
+        sections = sorted(_total_time.items(), key=lambda item: item[1], reverse=True)
+        calls = dict(_calls)
+        self_by_name = defaultdict(float)
+        for stack, seconds in _self_time.items():
+            self_by_name[stack.rsplit(";", 1)[-1]] += seconds
+
+    lines = [
+        f"{'section':<28}{'calls':>8}{'total (s)':>12}{'self (s)':>12}{'avg (ms)':>12}",
+        "-" * 72,
+    ]
+    for name, total in sections[:top]:
+        count = calls.get(name, 0)
+        avg = total / count * 1000 if count else 0
+        lines.append(
+            f"{name:<28}{count:>8}{total:>12.3f}{self_by_name[name]:>12.3f}{avg:>12.2f}"
+        )
+
+    jobs = slowest_jobs(top)
+    if jobs:
+        lines.append("")
+        lines.append("Costliest job descriptions to extract:")
+        for seconds, link, description in jobs:
+            lines.append(
+                f"  {seconds * 1000:>9.1f} ms  {len(description):>7} chars  {link}"
+            )
+
+    return "\n".join(lines)
@@ -0,0 +1,112 @@
+"""
+Run extraction again over an archive of raw responses, without the network.
+
+Records are split into chunks that are extracted in parallel on all cores,
+so improvements to the extractors can be applied to past data quickly.
+"""
+
+import os
+import json
+import concurrent.futures
+
+import archive
+
+
+# responses that hold jobs or their descriptions (dice_detail records carry
+# the search result of their job, so dice_search pages are not needed)
+EXTRACTABLE = ("dice_detail", "indeed_page", "indeed_jobdescs")
+
+
+def extract_record(header, body, scrapers, results):
+    """
+    Add what can be extracted from a single archived response to results.
+    `scrapers` are the scraper classes by site, their extraction helpers
+    need no instance.
+    """
+    meta = header["meta"]
+    if header["kind"] == "dice_detail":
+        dice_scraper = scrapers["dice"]
+        page = body.decode("utf-8", errors="replace")
+        # the same markup as a live run, so both use the same cache entries
+        description = dice_scraper.find_job_description(page)
+        if description is not None:
+            results["dice"].append(
+                dice_scraper.get_job_detail(meta["job"], description)
+            )
+
+    elif header["kind"] == "indeed_page":
+        indeed_scraper = scrapers["indeed"]
+        _, jobs = indeed_scraper.find_jobs(body)
+        for job in jobs:
+            try:
+                listing = indeed_scraper.parse_job(job, meta.get("location", ""))
+            except (AttributeError, TypeError):
+                continue  # not a complete job post
+            if listing:
+                job_key, job_detail = listing
+                results["listings"][job_key] = job_detail
+
+    else:
+        descriptions = json.loads(body)
+        for job_key, job_detail in meta["jobs"].items():
+            job_desc = descriptions.get(job_key)
+            more_detail = scrapers["indeed"].get_more_detail(job_desc, job_detail[-1])
+            results["descriptions"][job_key] = more_detail
+            # the details saved with the descriptions are only used when the
+            # result page of the job is not in the archive
+            results["archived"][job_key] = job_detail
+
+
+def extract_chunk(path, entries, scrapers):
+    """Extract every record of a chunk of index entries (runs in a worker process)."""
+    response_archive = archive.ResponseArchive(path)
+    results = {"dice": [], "listings": {}, "descriptions": {}, "archived": {}}
+    with open(path, "rb") as file:
+        for entry in entries:
+            try:
+                header, body = response_archive.read(entry, file)
+                extract_record(header, body, scrapers, results)
+            except Exception as e:
+                print(f"Failed to extract {entry['url']}: {e}")
+    return results
+
+
+def replay(path, scraper_classes, on_rows, workers=None, chunk_size=200):
+    """
+    Extract all descriptions in the archive at path with the given scraper
+    classes and pass the rows to `on_rows(site, rows)`. Returns the number
+    of rows.
+
+    Indeed jobs are extracted from their result page and description response
+    separately (in any chunk), and joined by job key once all are done.
+    """
+    scrapers = {scraper_class.site: scraper_class for scraper_class in scraper_classes}
+    entries = archive.ResponseArchive(path).index(EXTRACTABLE)
+    chunks = [entries[i : i + chunk_size] for i in range(0, len(entries), chunk_size)]
+    print(f"Replaying {len(entries)} responses in {len(chunks)} chunks...")
+
+    total = 0
+    listings, descriptions, archived = {}, {}, {}
+    workers = workers or os.cpu_count()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(extract_chunk, path, chunk, scrapers) for chunk in chunks
+        ]
+        for future in concurrent.futures.as_completed(futures):
+            results = future.result()
+            if results["dice"]:
+                on_rows("dice", results["dice"])
+                total += len(results["dice"])
+            listings.update(results["listings"])
+            descriptions.update(results["descriptions"])
+            archived.update(results["archived"])
+
+    rows = [
+        scrapers["indeed"].add_more_detail(
+            listings.get(job_key, archived[job_key]), more_detail
+        )
+        for job_key, more_detail in descriptions.items()
+    ]
+    if rows:
+        on_rows("indeed", rows)
+    return total + len(rows)
@@ -0,0 +1,202 @@
+"""
+A SQLite store for scraped jobs, kept next to the CSV files.
+
+Rows are upserted by (site, job id) so re-scraping or enriching a job updates
+it in place, and a full-text index over the title and the extracted details
+makes keyword searches across months of data fast.
+"""
+
+import re
+import sqlite3
+import threading
+from datetime import datetime
+from urllib.parse import urlparse, parse_qs
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    site TEXT NOT NULL,
+    job_id TEXT NOT NULL,
+    company TEXT,
+    title TEXT,
+    salary INTEGER,
+    location TEXT,
+    country TEXT,
+    expectations TEXT,
+    qualification TEXT,
+    experience TEXT,
+    remote INTEGER,
+    link TEXT,
+    updated_at TEXT,
+    PRIMARY KEY (site, job_id)
+);
+
+CREATE INDEX IF NOT EXISTS jobs_salary ON jobs (salary);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS jobs_fts USING fts5(
+    title, expectations, qualification, experience,
+    content='jobs', content_rowid='rowid'
+);
+
+CREATE TRIGGER IF NOT EXISTS jobs_ai AFTER INSERT ON jobs BEGIN
+    INSERT INTO jobs_fts (rowid, title, expectations, qualification, experience)
+    VALUES (new.rowid, new.title, new.expectations, new.qualification, new.experience);
+END;
+
+CREATE TRIGGER IF NOT EXISTS jobs_ad AFTER DELETE ON jobs BEGIN
+    INSERT INTO jobs_fts (jobs_fts, rowid, title, expectations, qualification, experience)
+    VALUES ('delete', old.rowid, old.title, old.expectations, old.qualification, old.experience);
+END;
+
+CREATE TRIGGER IF NOT EXISTS jobs_au AFTER UPDATE ON jobs BEGIN
+    INSERT INTO jobs_fts (jobs_fts, rowid, title, expectations, qualification, experience)
+    VALUES ('delete', old.rowid, old.title, old.expectations, old.qualification, old.experience);
+    INSERT INTO jobs_fts (rowid, title, expectations, qualification, experience)
+    VALUES (new.rowid, new.title, new.expectations, new.qualification, new.experience);
+END;
+"""
+
+# rows saved from the listing pages have no details yet, they must not
+# overwrite details that were already extracted for the job
+UPSERT = """
+INSERT INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (site, job_id) DO UPDATE SET
+    company = excluded.company,
+    title = excluded.title,
+    salary = CASE WHEN excluded.salary > 0 THEN excluded.salary ELSE jobs.salary END,
+    location = excluded.location,
+    country = excluded.country,
+    expectations = CASE WHEN excluded.expectations != ''
+        THEN excluded.expectations ELSE jobs.expectations END,
+    qualification = CASE WHEN excluded.qualification != ''
+        THEN excluded.qualification ELSE jobs.qualification END,
+    experience = CASE WHEN excluded.experience != ''
+        THEN excluded.experience ELSE jobs.experience END,
+    remote = excluded.remote,
+    link = excluded.link,
+    updated_at = excluded.updated_at
+"""
+
+
+def get_job_id(site, link):
+    """Get the id of a job from its link."""
+    url = urlparse(link)
+    if site == "indeed":
+        job_key = parse_qs(url.query).get("jk")
+        if job_key:
+            return job_key[0]
+    # dice links end with the id of the job
+    return url.path.rstrip("/").split("/")[-1] or link
+
+
+def quote_keywords(keywords):
+    """Quote every search term so FTS5 doesn't read c++ or full-stack as query syntax."""
+    terms = keywords.split()
+    return " ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+
+def parse_salary(salary):
+    """Convert a cleaned salary (like $120000) to a number."""
+    digits = re.sub(r"\D", "", str(salary))
+    return int(digits) if digits else 0
+
+
+class ResultStore:
+    """Scraped jobs saved in a SQLite database with a full-text index."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+
+    def save(self, site, job_list):
+        """Upsert a batch of CSV rows in a single transaction."""
+        if type(job_list) == dict:
+            job_list = list(job_list.values())
+
+        now = datetime.now().isoformat(timespec="seconds")
+        records = []
+        for row in job_list:
+            (company, title, salary, location, country) = row[:5]
+            (expectations, qualification, experience, remote, link) = row[5:10]
+            records.append(
+                (
+                    site,
+                    get_job_id(site, link),
+                    company,
+                    title,
+                    parse_salary(salary),
+                    location,
+                    country,
+                    expectations,
+                    qualification,
+                    experience,
+                    1 if remote == "Yes" else 0,
+                    link,
+                    now,
+                )
+            )
+
+        with self._lock, self._db:
+            self._db.executemany(UPSERT, records)
+
+    def search(self, keywords="", min_salary=0, remote=False, site=None, limit=50):
+        """Find jobs matching a full-text query and filters, best matches first."""
+        sql = "SELECT jobs.* FROM jobs"
+        conditions, params = [], []
+        if keywords:
+            sql += " JOIN jobs_fts ON jobs_fts.rowid = jobs.rowid"
+            conditions.append("jobs_fts MATCH ?")
+            params.append(quote_keywords(keywords))
+        if min_salary:
+            conditions.append("jobs.salary >= ?")
+            params.append(min_salary)
+        if remote:
+            conditions.append("jobs.remote = 1")
+        if site:
+            conditions.append("jobs.site = ?")
+            params.append(site)
+
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += (
+            " ORDER BY jobs_fts.rank" if keywords else " ORDER BY jobs.updated_at DESC"
+        )
+        sql += " LIMIT ?"
+        params.append(limit)
+
+        with self._lock:
+            cursor = self._db.execute(sql, params)
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+result_store = None
+
+
+def configure(path):
+    """Save the rows of every scraper to the database at path as well."""
+    global result_store
+    close()
+    result_store = ResultStore(path) if path else None
+    return result_store
+
+
+def save(site, job_list):
+    """Save rows to the configured store (does nothing if there is none)."""
+    if result_store is not None and job_list:
+        result_store.save(site, job_list)
+
+
+def close():
+    global result_store
+    if result_store is not None:
+        result_store.close()
+        result_store = None
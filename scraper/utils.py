@@ -6,6 +6,30 @@ import os
 import re
 import csv
 import bs4
+import threading
+
+import profiler
+
+
+FIELDS = (
+    "Company",
+    "Title",
+    "Salary",
+    "Location",
+    "Country",
+    "Expectations",
+    "Qualifications",
+    "Experience",
+    "Remote",
+    "Link",
+)
+
+# CSV files are appended to and rewritten from several threads
+csv_lock = threading.Lock()
+
+# functions called with (site, job_list) for every batch of saved jobs
+# (e.g. the SQLite store), in addition to the CSV file
+sinks = []
 
 
 def get_home_dir():
@@ -16,53 +40,95 @@ def get_home_dir():
         return os.path.expanduser("~/")
 
 
-def save_to_csv(job_list, filename):
-    """Save a list of jobs to a CSV file."""
+def get_desktop_path(filename):
+    """Get the full path of a file saved to the Desktop."""
     home_dir = get_home_dir()
     if os.name == "nt":
-        full_path = os.path.join(home_dir, "Desktop\\" + filename)
+        return os.path.join(home_dir, "Desktop\\" + filename)
     else:
-        full_path = os.path.join(home_dir, "Desktop/" + filename)
-
-    mode = "a" if os.path.exists(full_path) else "w"
-    with open(full_path, mode=mode, newline="", encoding="utf-8") as file:
-        csv_writer = csv.writer(file)
-        fields = (
-            "Company",
-            "Title",
-            "Salary",
-            "Location",
-            "Country",
-            "Expectations",
-            "Qualifications",
-            "Experience",
-            "Remote",
-            "Link",
-        )
-        if mode == "w":
-            csv_writer.writerow(fields)  # write headers
-
-        if type(job_list) == dict:
-            csv_writer.writerows(list(job_list.values()))
-        else:
-            csv_writer.writerows(job_list)
+        return os.path.join(home_dir, "Desktop/" + filename)
 
 
-def save_progress(page_num, filename, scraper):
+def save_to_csv(job_list, filename):
+    """Save a list of jobs to a CSV file."""
+    full_path = get_desktop_path(filename)
+
+    with csv_lock:
+        mode = "a" if os.path.exists(full_path) else "w"
+        with open(full_path, mode=mode, newline="", encoding="utf-8") as file:
+            csv_writer = csv.writer(file)
+            if mode == "w":
+                csv_writer.writerow(FIELDS)  # write headers
+
+            if type(job_list) == dict:
+                csv_writer.writerows(list(job_list.values()))
+            else:
+                csv_writer.writerows(job_list)
+
+
+def upsert_csv_rows(job_list, filename):
+    """Replace rows of a CSV file that have the same link, append the others."""
+    full_path = get_desktop_path(filename)
+    new_rows = {row[-1]: list(row) for row in job_list}
+
+    with csv_lock:
+        rows = []
+        if os.path.exists(full_path):
+            with open(full_path, newline="", encoding="utf-8") as file:
+                rows = list(csv.reader(file))[1:]  # skip headers
+
+        for i, row in enumerate(rows):
+            if row and row[-1] in new_rows:
+                rows[i] = new_rows.pop(row[-1])
+        rows.extend(new_rows.values())
+
+        # write to a temporary file first so an interruption can't lose rows
+        tmp_path = full_path + ".tmp"
+        with open(tmp_path, mode="w", newline="", encoding="utf-8") as file:
+            csv_writer = csv.writer(file)
+            csv_writer.writerow(FIELDS)
+            csv_writer.writerows(rows)
+        os.replace(tmp_path, full_path)
+
+
+def get_saved_links(filename):
+    """Return the links of the jobs already saved to a CSV file."""
+    full_path = get_desktop_path(filename)
+    with csv_lock:
+        if not os.path.exists(full_path):
+            return set()
+        with open(full_path, newline="", encoding="utf-8") as file:
+            return {row[-1] for row in list(csv.reader(file))[1:] if row}
+
+
+def save_jobs(site, job_list, filename, upsert=False):
+    """Save jobs to the CSV file (updating existing rows if upsert) and the sinks."""
+    if upsert:
+        upsert_csv_rows(job_list, filename)
+    else:
+        save_to_csv(job_list, filename)
+
+    if type(job_list) == dict:
+        job_list = list(job_list.values())
+    for sink in sinks:
+        sink(site, job_list)
+
+
+def save_progress(page_num, filename, scraper, phase="scraper"):
     """Save scraping progress to avoid repeated extraction."""
 
     target = "dice" if scraper == 1 else "indeed"
-    config_file = f".{target}_scraper_progress.txt"
+    config_file = f".{target}_{phase}_progress.txt"
     config_file_path = os.path.join(get_home_dir(), config_file)
     with open(config_file_path, "w") as file:
         file.write(f"{page_num},{filename}")
 
 
-def get_progress(search_term, scraper):
+def get_progress(search_term, scraper, phase="scraper"):
     """Get the progress of scraper to continue where it left off."""
 
     target = "dice" if scraper == 1 else "indeed"
-    config_file = f".{target}_scraper_progress.txt"
+    config_file = f".{target}_{phase}_progress.txt"
     home_dir = get_home_dir()
     config_path = os.path.join(home_dir, config_file)
     if os.path.exists(config_path):
@@ -86,6 +152,13 @@ def get_progress(search_term, scraper):
     return None
 
 
+def get_text(job_desc):
+    """Get the text of a job description (a tag or a plain summary)."""
+    if type(job_desc) == bs4.element.Tag:
+        return job_desc.text
+    return job_desc or ""
+
+
 def clean_salary(salary):
     """Clean the salary given. Convert hourly rates to yearly and remove salary ranges."""
     salary = salary.strip()
@@ -156,6 +229,7 @@ def extract_from_sibling(all_p, pattern):
     return match
 
 
+@profiler.timed()
 def get_responsibility(job_desc):
     """Extract responsibility associated with the job (if any)."""
     # a regex pattern used to search for responsibility
@@ -199,6 +273,7 @@ def get_responsibility(job_desc):
     return responsibility
 
 
+@profiler.timed()
 def get_skills_and_experience(job_desc):
     """Extract skills and experience required for the job."""
     pattern = r"\b(experience|years|\+ years|yrs)\b"
@@ -257,6 +332,7 @@ def get_skills_and_experience(job_desc):
     return skills, experience
 
 
+@profiler.timed()
 def get_qualification(job_desc):
     """Extract qualification required for the job (if any)."""
 
@@ -282,3 +358,12 @@ def get_qualification(job_desc):
     elif match_two:
         qualification = match_two.group(0)
     return qualification
+
+
+def extract_description(job_desc):
+    """Extract expectations, qualification and experience from a job description."""
+    responsibility = get_responsibility(job_desc)
+    qualification = get_qualification(job_desc)
+    skills, experience = get_skills_and_experience(job_desc)
+    expectations = f"{responsibility}\n{skills}"
+    return expectations, qualification, experience